@@ -1,5 +1,6 @@
 # --- 定数定義 ---
 MAX_CANVASES = 20
+PARALLEL_REVIEW_COLUMNS = 3  # 一括レビュー時に横並びで表示するCanvasの数
 
 # --- 環境変数キー名 ---
 AZURE_OPENAI_KEY_NAME = "AZURE_OPENAI_KEY"
@@ -7,6 +8,17 @@ AZURE_OPENAI_ENDPOINT_NAME = "AZURE_OPENAI_ENDPOINT"
 AZURE_OPENAI_DEPLOYMENT_NAME = "AZURE_OPENAI_DEPLOYMENT"
 AZURE_OPENAI_API_VERSION_NAME = "AZURE_OPENAI_API_VERSION"
 
+# --- プロンプトテンプレート設定 ---
+# 各プロンプトが持つべきプレースホルダー (起動時に prompts.yaml と照合する)
+# None はフォーマットせずにそのまま使うプロンプト (波括弧を含んでいてもよい)
+REQUIRED_PROMPT_PLACEHOLDERS = {
+    "system": None,
+    "validation": frozenset({"code_for_prompt", "pylint_report"}),
+    "review_merge": frozenset({"reviews"}),
+}
+# .envごとのプロンプト上書きファイルの拡張子 (例: env/foo.env -> env/foo.prompts.yaml)
+PROMPT_OVERRIDE_SUFFIX = ".prompts.yaml"
+
 # --- streamlit-ace (コードエディタ) 設定 ---
 ACE_EDITOR_SETTINGS = {
     "language": "python",
@@ -27,7 +39,9 @@ SESSION_STATE_DEFAULTS = {
     "python_canvases": [ACE_EDITOR_DEFAULT_CODE],
     "multi_code_enabled": False,
     "stop_generation": False,
-    "canvas_key_counter": 0
+    "canvas_key_counter": 0,
+    "parallel_review_pending": False,
+    "merge_parallel_reviews": True
 }
 
 # --- UIに表示されるテキスト ---
@@ -51,6 +65,12 @@ class UITexts:
     REVIEW_BUTTON = "レビュー"
     VALIDATE_BUTTON = "検証"
     VALIDATE_BUTTON_HELP = "pylintでCanvas-{i}のコードを検証し、結果をAIが分析します。"
+    REVIEW_ALL_BUTTON = "全Canvasを一括レビュー"
+    REVIEW_ALL_BUTTON_HELP = "Canvasごとに個別のリクエストを同時に送信し、レビュー結果を並べて表示します。"
+    MERGE_REVIEWS_CHECKBOX = "一括レビュー後に結果を統合する"
+
+    PROMPT_TEMPLATES_EXPANDER = "プロンプトテンプレート"
+    PROMPT_TEMPLATE_INFO = "**{name}**: 推定 {tokens:,} トークン (`{source}`)  \n{description}"
 
     SYSTEM_PROMPT_HEADER = "最初にAIの役割（システムプロンプト）を設定してください"
     SYSTEM_PROMPT_TEXT_AREA_LABEL = "AIの役割"
@@ -77,3 +97,10 @@ class UITexts:
     REVIEW_PROMPT_SINGLE = "### 参考コード (Canvas)\n上記のコードをレビューし、改善点を提案してください。"
     REVIEW_PROMPT_MULTI = "### 参考コード (Canvas-{i})\nこのCanvasのコードをレビューし、改善点を提案してください。"
     GENERATION_STOPPED_WARNING = "ユーザーによって応答の生成が中断されました。"
+
+    # --- 全Canvas一括レビュー ---
+    NO_CODE_TO_REVIEW = "レビューするコードがありません。"
+    REVIEW_ALL_USER_MESSAGE = "全Canvas (Canvas-{indices}) を一括でレビューしてください。"
+    REVIEW_ALL_SECTION_HEADER = "#### Canvas-{i} のレビュー"
+    REVIEW_ALL_MERGE_HEADER = "#### 統合サマリー"
+    REVIEW_ALL_ERROR = "Canvas-{i} のレビュー中にエラーが発生しました: {e}"
@@ -2,6 +2,7 @@ import os
 import json
 import sys
 import time
+import contextlib
 
 import streamlit as st
 from dotenv import load_dotenv
@@ -64,13 +65,109 @@ def load_history(uploader_key):
         st.error(config.UITexts.JSON_LOAD_ERROR.format(e=e))
 
 
+def run_parallel_review(client, deployment_name, prompts):
+    """
+    Canvasごとに個別のレビューリクエストを同時に送信し、結果を横並びでストリーミング表示する。
+    設定に応じて、最後にレビュー結果を1つのサマリーに統合する。
+    """
+    canvases = st.session_state['python_canvases']
+    messages = st.session_state['messages']
+    target_indices = utils.get_reviewable_canvas_indices(canvases)
+    if not target_indices:
+        # クリック後に履歴の読み込みなどでCanvasが空になった場合は、未回答の依頼メッセージを取り消す
+        if messages and messages[-1]["role"] == "user":
+            messages.pop()
+        st.session_state['is_generating'] = False
+        st.session_state['stop_generation'] = False
+        st.session_state['parallel_review_pending'] = False
+        st.toast(config.UITexts.NO_CODE_TO_REVIEW, icon="⚠️")
+        st.rerun()
+    selected_effort = st.session_state.get('reasoning_effort', 'medium')
+    input_prompts = {i: utils.format_canvas_review_input(messages, canvases, i) for i in target_indices}
+
+    reviews = {i: "" for i in target_indices}
+    failed_indices = set()
+    merged_summary = ""
+    usage_totals = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+    stopped = False
+
+    def accumulate_usage(usage):
+        usage_totals["input_tokens"] += usage.input_tokens
+        usage_totals["output_tokens"] += usage.output_tokens
+        usage_totals["total_tokens"] += usage.total_tokens
+
+    with st.chat_message("assistant"):
+        placeholders = {}
+        columns_per_row = config.PARALLEL_REVIEW_COLUMNS
+        for row_start in range(0, len(target_indices), columns_per_row):
+            row_indices = target_indices[row_start:row_start + columns_per_row]
+            for column, i in zip(st.columns(columns_per_row), row_indices):
+                column.markdown(config.UITexts.REVIEW_ALL_SECTION_HEADER.format(i=i + 1))
+                placeholders[i] = column.empty()
+
+        try:
+            with contextlib.closing(utils.stream_responses_concurrently(client, deployment_name, selected_effort, input_prompts)) as events:
+                for key, kind, payload in events:
+                    if st.session_state['stop_generation']:
+                        st.warning(config.UITexts.GENERATION_STOPPED_WARNING)
+                        stopped = True
+                        break
+                    if kind == "delta":
+                        reviews[key] += payload
+                        placeholders[key].markdown(reviews[key] + "▌")
+                    elif kind == "usage":
+                        accumulate_usage(payload)
+                    elif kind == "error":
+                        failed_indices.add(key)
+                        placeholders[key].error(config.UITexts.REVIEW_ALL_ERROR.format(i=key + 1, e=payload))
+                    elif kind == "done" and key not in failed_indices:
+                        placeholders[key].markdown(reviews[key])
+
+            completed_reviews = {i: text for i, text in reviews.items() if text and i not in failed_indices}
+            if not stopped and st.session_state['merge_parallel_reviews'] and len(completed_reviews) > 1:
+                st.markdown(config.UITexts.REVIEW_ALL_MERGE_HEADER)
+                merge_placeholder = st.empty()
+                merge_input = utils.format_review_merge_input(messages, completed_reviews, prompts)
+                with contextlib.closing(utils.stream_responses_concurrently(client, deployment_name, selected_effort, {"merge": merge_input})) as events:
+                    for _, kind, payload in events:
+                        if st.session_state['stop_generation']:
+                            st.warning(config.UITexts.GENERATION_STOPPED_WARNING)
+                            break
+                        if kind == "delta":
+                            merged_summary += payload
+                            merge_placeholder.markdown(merged_summary + "▌")
+                        elif kind == "usage":
+                            accumulate_usage(payload)
+                        elif kind == "error":
+                            st.error(config.UITexts.API_REQUEST_ERROR.format(e=payload))
+                merge_placeholder.markdown(merged_summary)
+        except Exception as e:
+            st.error(config.UITexts.API_REQUEST_ERROR.format(e=e))
+        finally:
+            st.session_state['is_generating'] = False
+            st.session_state['stop_generation'] = False
+            st.session_state['parallel_review_pending'] = False
+            if usage_totals["total_tokens"]:
+                for usage_key, value in usage_totals.items():
+                    st.session_state['total_usage'][usage_key] += value
+                st.session_state['last_usage_info'] = usage_totals
+            sections = [
+                f"{config.UITexts.REVIEW_ALL_SECTION_HEADER.format(i=i + 1)}\n{reviews[i]}"
+                for i in target_indices if reviews[i]
+            ]
+            if merged_summary:
+                sections.append(f"{config.UITexts.REVIEW_ALL_MERGE_HEADER}\n{merged_summary}")
+            if sections:
+                st.session_state['messages'].append({"role": "assistant", "content": "\n\n".join(sections)})
+            st.rerun()
+
+
 # --- Streamlit アプリケーション ---
 
 def run_chatbot_app():
     st.set_page_config(page_title=config.UITexts.APP_TITLE, layout="wide")
     st.title(config.UITexts.APP_TITLE)
     
-    PROMPTS = utils.load_prompts()
     APP_CONFIG = utils.load_app_config()
     supported_types = APP_CONFIG.get("file_uploader", {}).get("supported_extensions", [])
     
@@ -79,6 +176,16 @@ def run_chatbot_app():
         st.error("`env` ディレクトリに `.env` ファイルが見つかりません。アプリケーションを続行できません。")
         st.stop()
 
+    if 'selected_env_file' not in st.session_state:
+        st.session_state['selected_env_file'] = env_files[0]
+
+    # すべての.envの上書きファイルを起動時に検証し、モデル切り替え時に初めてエラーになるのを防ぐ (結果はキャッシュされる)
+    for env_file in env_files:
+        utils.load_prompts(env_file)
+
+    # 選択中の.envに対応する上書きを反映した、コンパイル・検証済みのテンプレート (ファイル更新時のみ再読み込み)
+    PROMPTS = utils.load_prompts(st.session_state['selected_env_file'])
+
     for key, value in config.SESSION_STATE_DEFAULTS.items():
         if key not in st.session_state:
             st.session_state[key] = value.copy() if isinstance(value, (dict, list)) else value
@@ -101,6 +208,18 @@ def run_chatbot_app():
         st.session_state['messages'].append({"role": "user", "content": prompt})
         st.session_state['is_generating'] = True
 
+    def handle_review_all():
+        """中身のある全Canvasを対象に、一括(並列)レビューを開始する"""
+        target_indices = utils.get_reviewable_canvas_indices(st.session_state['python_canvases'])
+        if not target_indices:
+            st.toast(config.UITexts.NO_CODE_TO_REVIEW, icon="⚠️")
+            return
+        indices_text = ", ".join(str(i + 1) for i in target_indices)
+        st.session_state['messages'].append({"role": "user", "content": config.UITexts.REVIEW_ALL_USER_MESSAGE.format(indices=indices_text)})
+        st.session_state['parallel_review_pending'] = True
+        st.session_state['is_generating'] = True
+        st.session_state['stop_generation'] = False
+
     def handle_validation(canvas_index):
         """指定されたCanvasのpylint検証を実行する"""
         if 0 <= canvas_index < len(st.session_state['python_canvases']):
@@ -118,12 +237,9 @@ def run_chatbot_app():
             except Exception as e:
                 st.error(f"ファイルの読み込みに失敗しました: {e}")
 
-    sidebar.render_sidebar(supported_types, env_files, load_history, handle_clear, handle_review, handle_validation, handle_file_upload)
+    sidebar.render_sidebar(supported_types, env_files, PROMPTS, load_history, handle_clear, handle_review, handle_review_all, handle_validation, handle_file_upload)
     
     # --- .envファイルのロードとクライアント設定 ---
-    if 'selected_env_file' not in st.session_state:
-        st.session_state['selected_env_file'] = env_files[0]
-
     load_dotenv(dotenv_path=st.session_state['selected_env_file'], override=True)
     if st.session_state.get('loaded_env') != st.session_state['selected_env_file']:
         st.sidebar.success(f"`{os.path.basename(st.session_state['selected_env_file'])}` を読み込みました。")
@@ -154,7 +270,7 @@ def run_chatbot_app():
     # --- メインコンテンツ ---
     if not st.session_state['system_role_defined']:
         st.subheader(config.UITexts.SYSTEM_PROMPT_HEADER)
-        system_prompt_input = st.text_area(config.UITexts.SYSTEM_PROMPT_TEXT_AREA_LABEL, value=PROMPTS.get("system", {}).get("text", ""), height=300)
+        system_prompt_input = st.text_area(config.UITexts.SYSTEM_PROMPT_TEXT_AREA_LABEL, value=PROMPTS["system"].text, height=300)
         if st.button(config.UITexts.START_CHAT_BUTTON, type="primary"):
             st.session_state['messages'] = [{"role": "system", "content": system_prompt_input}]
             st.session_state['system_role_defined'] = True
@@ -191,7 +307,9 @@ def run_chatbot_app():
         st.session_state['stop_generation'] = False
         st.rerun()
 
-    if st.session_state['is_generating']:
+    if st.session_state['is_generating'] and st.session_state['parallel_review_pending']:
+        run_parallel_review(client, env_vars['deployment_name'], PROMPTS)
+    elif st.session_state['is_generating']:
         with st.chat_message("assistant"):
             placeholder = st.empty()
             full_response = ""
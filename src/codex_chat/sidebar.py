@@ -5,7 +5,7 @@ import time
 from streamlit_ace import st_ace
 from . import config
 
-def render_sidebar(supported_types, env_files, load_history, handle_clear, handle_review, handle_validation, handle_file_upload):
+def render_sidebar(supported_types, env_files, prompts, load_history, handle_clear, handle_review, handle_review_all, handle_validation, handle_file_upload):
     """
     Streamlitアプリケーションのサイドバーを描画する関数
     """
@@ -78,6 +78,15 @@ def render_sidebar(supported_types, env_files, load_history, handle_clear, handl
 
         st.info(config.UITexts.CODEX_MINI_INFO)
 
+        with st.expander(config.UITexts.PROMPT_TEMPLATES_EXPANDER):
+            for name, template in prompts.items():
+                st.markdown(config.UITexts.PROMPT_TEMPLATE_INFO.format(
+                    name=name,
+                    tokens=template.fixed_token_count,
+                    source=os.path.basename(template.source),
+                    description=template.description
+                ))
+
         st.subheader(config.UITexts.HISTORY_SUBHEADER)
         if not st.session_state['is_generating'] and st.session_state['messages']:
             history_data = {
@@ -119,6 +128,15 @@ def render_sidebar(supported_types, env_files, load_history, handle_clear, handl
             if len(st.session_state['python_canvases']) < config.MAX_CANVASES and st.button(config.UITexts.ADD_CANVAS_BUTTON, use_container_width=True, disabled=st.session_state['is_generating']):
                 st.session_state['python_canvases'].append(config.ACE_EDITOR_DEFAULT_CODE)
                 st.rerun()
+
+            st.button(
+                config.UITexts.REVIEW_ALL_BUTTON,
+                use_container_width=True,
+                help=config.UITexts.REVIEW_ALL_BUTTON_HELP,
+                on_click=handle_review_all,
+                disabled=st.session_state['is_generating']
+            )
+            st.session_state['merge_parallel_reviews'] = st.checkbox(config.UITexts.MERGE_REVIEWS_CHECKBOX, value=st.session_state['merge_parallel_reviews'], disabled=st.session_state['is_generating'])
             
             for i, content in enumerate(st.session_state['python_canvases']):
                 st.write(f"**Canvas-{i + 1}**")
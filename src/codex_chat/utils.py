@@ -1,9 +1,15 @@
 import os
 import sys
 import json
+import math
 import yaml
+import queue
+import string
 import tempfile
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from importlib import resources
 
 import streamlit as st
@@ -11,18 +17,141 @@ import streamlit as st
 from . import config
 
 
-@st.cache_data
-def load_prompts():
+def estimate_token_count(text):
     """
-    パッケージ内のprompts.yamlを一度だけ読み込み、結果をキャッシュする
+    テキストのおおよそのトークン数を見積もる (ASCIIは約4文字で1トークン、それ以外は1文字で約1トークン)
     """
+    ascii_chars = sum(1 for c in text if c.isascii())
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """
+    事前にコンパイル (プレースホルダー解析) 済みのプロンプトテンプレート
+    """
+    name: str
+    description: str
+    text: str
+    source: str
+    segments: tuple  # (リテラル文字列, プレースホルダー名 or None) のタプル
+    placeholders: frozenset
+    fixed_token_count: int  # プレースホルダーを空にした状態の推定トークン数 (各リクエストの固定オーバーヘッド)
+
+    def render(self, **kwargs):
+        """
+        解析済みのセグメントを連結してプロンプトを生成する
+        """
+        missing = self.placeholders - kwargs.keys()
+        if missing:
+            raise KeyError(f"プロンプト '{self.name}' に必要な値が不足しています: {', '.join(sorted(missing))}")
+        return "".join(literal + (str(kwargs[field]) if field else "") for literal, field in self.segments)
+
+def compile_prompt_template(name, entry, source):
+    """
+    prompts.yamlの1エントリを解析し、PromptTemplateを生成する (不正な書式はValueError)
+    """
+    if not isinstance(entry, dict) or not isinstance(entry.get("text"), str):
+        raise ValueError(f"プロンプト '{name}' に 'text' が定義されていません。")
+    text = entry["text"]
+    if name in config.REQUIRED_PROMPT_PLACEHOLDERS and config.REQUIRED_PROMPT_PLACEHOLDERS[name] is None:
+        # フォーマットしないプロンプトは解析せず、テキスト全体を1つのリテラルとして扱う
+        return PromptTemplate(
+            name=name,
+            description=entry.get("description", ""),
+            text=text,
+            source=source,
+            segments=((text, None),),
+            placeholders=frozenset(),
+            fixed_token_count=estimate_token_count(text),
+        )
     try:
-        with resources.open_text("codex_chat", "prompts.yaml") as f:
-            yaml_data = yaml.safe_load(f)
-            return yaml_data.get("prompts", {})
+        parsed = list(string.Formatter().parse(text))
+    except ValueError as e:
+        raise ValueError(f"プロンプト '{name}' の書式が不正です: {e}") from e
+
+    segments = []
+    for literal, field, format_spec, conversion in parsed:
+        if field is not None and (not field.isidentifier() or format_spec or conversion):
+            raise ValueError(f"プロンプト '{name}' のプレースホルダー '{{{field}}}' は単純な名前である必要があります。")
+        segments.append((literal, field))
+
+    placeholders = frozenset(field for _, field in segments if field)
+    required = config.REQUIRED_PROMPT_PLACEHOLDERS.get(name)
+    if required is not None and placeholders != required:
+        details = []
+        if required - placeholders:
+            details.append(f"不足: {', '.join(sorted(required - placeholders))}")
+        if placeholders - required:
+            details.append(f"未定義: {', '.join(sorted(placeholders - required))}")
+        raise ValueError(f"プロンプト '{name}' のプレースホルダーが不正です ({' / '.join(details)})。")
+
+    fixed_text = "".join(literal for literal, _ in segments)
+    return PromptTemplate(
+        name=name,
+        description=entry.get("description", ""),
+        text=text,
+        source=source,
+        segments=tuple(segments),
+        placeholders=placeholders,
+        fixed_token_count=estimate_token_count(fixed_text),
+    )
+
+def get_prompt_override_path(env_file):
+    """
+    .envファイルに対応するプロンプト上書きファイル (例: env/foo.env -> env/foo.prompts.yaml) のパスを返す
+    """
+    if not env_file:
+        return None
+    override_path = os.path.splitext(env_file)[0] + config.PROMPT_OVERRIDE_SUFFIX
+    return override_path if os.path.isfile(override_path) else None
+
+def _get_mtime(path):
+    return os.path.getmtime(path) if path and os.path.exists(path) else None
+
+def _read_prompt_entries(path):
+    with open(path, encoding="utf-8") as f:
+        yaml_data = yaml.safe_load(f) or {}
+    return yaml_data.get("prompts", {}) or {}
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _load_prompt_templates(base_path, base_mtime, override_path, override_mtime):
+    """
+    prompts.yaml (と上書きファイル) を読み込んでコンパイルする。
+    更新日時 (mtime) を引数に含めることで、ファイルが変更されたときだけ再読み込みされる。
+    """
+    entries = {name: (entry, base_path) for name, entry in _read_prompt_entries(base_path).items()}
+    if override_path:
+        for name, entry in _read_prompt_entries(override_path).items():
+            base_entry = entries.get(name, ({}, base_path))[0]
+            merged = {**base_entry, **entry} if isinstance(base_entry, dict) and isinstance(entry, dict) else entry
+            entries[name] = (merged, override_path)
+
+    missing = [name for name in config.REQUIRED_PROMPT_PLACEHOLDERS if name not in entries]
+    if missing:
+        raise ValueError(f"必須のプロンプトが定義されていません: {', '.join(missing)}")
+    templates = {}
+    for name, (entry, source) in entries.items():
+        try:
+            templates[name] = compile_prompt_template(name, entry, source)
+        except ValueError as e:
+            raise ValueError(f"{os.path.basename(source)}: {e}") from e
+    return templates
+
+def load_prompts(env_file=None):
+    """
+    プロンプトテンプレートを読み込み、コンパイル・検証済みの {名前: PromptTemplate} を返す。
+    env_fileに対応する上書きファイルがあれば、その内容でテンプレートを上書きする。
+    """
+    base_path = str(resources.files("codex_chat").joinpath("prompts.yaml"))
+    override_path = get_prompt_override_path(env_file)
+    try:
+        return _load_prompt_templates(base_path, _get_mtime(base_path), override_path, _get_mtime(override_path))
     except FileNotFoundError:
         st.error("重大なエラー: prompts.yamlが見つかりません。")
         st.stop()
+    except ValueError as e:
+        st.error(f"重大なエラー: プロンプトテンプレートの検証に失敗しました: {e}")
+        st.stop()
     except Exception as e:
         st.error(f"重大なエラー: prompts.yamlの読み込みに失敗しました: {e}")
         st.stop()
@@ -63,6 +192,114 @@ def format_history_for_input(messages, canvases):
     return formatted_string
 
 
+def get_reviewable_canvas_indices(canvases):
+    """
+    空、またはデフォルトのままではないCanvasのインデックス一覧を返す
+    """
+    return [
+        i for i, canvas_code in enumerate(canvases)
+        if canvas_code and canvas_code.strip() != config.ACE_EDITOR_DEFAULT_CODE.strip()
+    ]
+
+def format_canvas_review_input(messages, canvases, canvas_index):
+    """
+    指定したCanvasだけを含む、一括レビュー用の入力文字列を生成する
+    (システムプロンプト + 対象Canvas + レビュー依頼のみで、会話履歴や他のCanvasは含めない)
+    """
+    system_message = next((m for m in messages if m["role"] == "system"), {"role": "system", "content": ""})
+    review_prompt = config.UITexts.REVIEW_PROMPT_MULTI.format(i=canvas_index + 1)
+    # 他のCanvasを空文字にすることで、Canvas番号を維持したまま対象のCanvasだけを送信する
+    target_only = [code if i == canvas_index else "" for i, code in enumerate(canvases)]
+    return format_history_for_input([system_message, {"role": "user", "content": review_prompt}], target_only)
+
+def format_review_merge_input(messages, reviews, prompts):
+    """
+    Canvasごとのレビュー結果 ({canvas_index: text}) を統合するための入力文字列を生成する
+    """
+    system_message = next((m for m in messages if m["role"] == "system"), {"role": "system", "content": ""})
+    reviews_text = "\n\n".join(
+        f"{config.UITexts.REVIEW_ALL_SECTION_HEADER.format(i=i + 1)}\n{text}" for i, text in sorted(reviews.items())
+    )
+    merge_prompt = prompts["review_merge"].render(reviews=reviews_text)
+    return format_history_for_input([system_message, {"role": "user", "content": merge_prompt}], [])
+
+def _stream_response_worker(client, model, effort, key, input_prompt, event_queue, stop_event, open_streams):
+    """
+    1件のストリーミングリクエストを実行し、受信したイベントをキューに積む (ワーカースレッド用)
+    """
+    stream = None
+    try:
+        if stop_event.is_set():
+            return
+        stream = client.responses.create(
+            model=model,
+            input=input_prompt,
+            stream=True,
+            extra_body={"reasoning": {"effort": effort}}
+        )
+        # 中断時にスクリプト側のスレッドからも接続を閉じられるように登録しておく
+        open_streams.append(stream)
+        if stop_event.is_set():
+            return
+        for chunk in stream:
+            if stop_event.is_set():
+                break
+            if hasattr(chunk, 'type'):
+                if chunk.type == 'response.output_text.delta' and hasattr(chunk, 'delta') and chunk.delta:
+                    event_queue.put((key, "delta", chunk.delta))
+                elif chunk.type == 'response.completed' and hasattr(chunk, 'response'):
+                    usage = getattr(chunk.response, 'usage', None)
+                    if usage:
+                        event_queue.put((key, "usage", usage))
+    except Exception as e:
+        # 中断のために接続を閉じた場合の例外は報告しない
+        if not stop_event.is_set():
+            event_queue.put((key, "error", e))
+    finally:
+        if stream is not None:
+            _close_stream(stream)
+        event_queue.put((key, "done", None))
+
+def _close_stream(stream):
+    """
+    ストリーミング応答のHTTP接続を閉じる (既に閉じている場合のエラーは無視する)
+    """
+    try:
+        stream.close()
+    except Exception:
+        pass
+
+def stream_responses_concurrently(client, model, effort, input_prompts):
+    """
+    複数の入力 ({key: input_prompt}) を同時にストリーミングし、到着順に (key, kind, payload) を返すジェネレータ
+
+    kind は "delta" (テキスト差分), "usage" (トークン使用量), "error" (例外), "done" (完了) のいずれか。
+    Streamlitの描画はスクリプトのスレッドから行う必要があるため、ワーカーはキューにイベントを積むだけに留める。
+    ジェネレータを close() すると、開いている接続をすべて閉じ、ワーカーの終了を待たずに戻る。
+    """
+    remaining = len(input_prompts)
+    if remaining == 0:
+        return
+    event_queue = queue.Queue()
+    stop_event = threading.Event()
+    open_streams = []
+    executor = ThreadPoolExecutor(max_workers=remaining)
+    try:
+        for key, input_prompt in input_prompts.items():
+            executor.submit(_stream_response_worker, client, model, effort, key, input_prompt, event_queue, stop_event, open_streams)
+        while remaining:
+            event = event_queue.get()
+            if event[1] == "done":
+                remaining -= 1
+            yield event
+    finally:
+        # 途中で中断 (停止ボタン、close() など) された場合も、応答待ちの接続を閉じてワーカーを終了させる
+        stop_event.set()
+        for stream in list(open_streams):
+            _close_stream(stream)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
 def run_pylint_validation(canvas_code, canvas_index, prompts):
     """
     指定されたコードに対してpylintを実行し、AI分析用のプロンプトを生成または成功を通知する
@@ -110,8 +347,7 @@ def run_pylint_validation(canvas_code, canvas_index, prompts):
         return
 
     code_for_prompt = f"\n\n# 解析対象のコード (Canvas-{canvas_index + 1})\n```python\n{canvas_code}\n```"
-    validation_template = prompts.get("validation", {}).get("text", "")
-    validation_prompt = validation_template.format(code_for_prompt=code_for_prompt, pylint_report=pylint_report)
+    validation_prompt = prompts["validation"].render(code_for_prompt=code_for_prompt, pylint_report=pylint_report)
     
     system_message = st.session_state['messages'][0] if st.session_state['messages'] and st.session_state['messages'][0]["role"] == "system" else {"role": "system", "content": ""}
     st.session_state['special_generation_messages'] = [system_message, {"role": "user", "content": validation_prompt}]